@@ -23,6 +23,9 @@ class ClientApp:
         self.is_downloading = False
         self.download_save_path = ""
 
+        # Flag set while a server profile holds the socket
+        self.is_profiling = False
+
         # Login Frame
         self.login_frame = tk.Frame(self.root)
         self.login_frame.pack(pady=20)
@@ -118,11 +121,18 @@ class ClientApp:
         tk.Button(self.menu_frame, text="Download File", command=self.download_file).pack(fill=tk.X, pady=5)
         # Delete File button
         tk.Button(self.menu_frame, text="Delete File", command=self.delete_file).pack(fill=tk.X, pady=5)
+        # Storage Usage button
+        tk.Button(self.menu_frame, text="Storage Usage", command=self.show_usage).pack(fill=tk.X, pady=5)
+        # Admin-only Profile Server and Timing Spans buttons
+        tk.Button(self.menu_frame, text="Profile Server", command=self.profile_server).pack(fill=tk.X, pady=5)
+        tk.Button(self.menu_frame, text="Timing Spans", command=self.toggle_timing).pack(fill=tk.X, pady=5)
         # Exit button
         tk.Button(self.menu_frame, text="Exit", command=self.exit_app).pack(fill=tk.X, pady=5)
 
     def upload_file(self):
         """Initiates the file upload process."""
+        if self._profile_running():
+            return
         filepath = filedialog.askopenfilename(title="Select a File to Upload")
         if not filepath:
             return
@@ -135,8 +145,16 @@ class ClientApp:
             with self.socket_lock:
                 # Send "UPLOAD" command to the server
                 self.client_socket.sendall(b"UPLOAD")
-                # Send the filename
-                self.client_socket.sendall(filename.encode())
+                # Send the filename and size so the server can check the quota
+                filesize = os.path.getsize(filepath)
+                self.client_socket.sendall(f"{filename},{filesize}".encode())
+
+                # Wait for the server to accept the upload before sending the body
+                status = self._recv_status()
+                if status != "OK":
+                    messagebox.showerror("Upload Error", status)
+                    self.log(f"Upload rejected: {status}")
+                    return
 
                 # Open and read the file in binary mode
                 with open(filepath, "rb") as f:
@@ -151,7 +169,7 @@ class ClientApp:
                 # Send EOF marker with size 0
                 self.client_socket.sendall((0).to_bytes(4, byteorder="big"))
                 # Receive server response
-                response = self.client_socket.recv(1024).decode()
+                response = self._recv_status()
                 messagebox.showinfo("Upload", response)
                 self.log(f"Uploaded file: {filename}")
 
@@ -161,6 +179,8 @@ class ClientApp:
 
     def list_files(self):
         """Requests the list of available files from the server."""
+        if self._profile_running():
+            return
         try:
             with self.socket_lock:
                 # Send "LIST" command to the server
@@ -179,6 +199,8 @@ class ClientApp:
 
     def download_file(self):
         """Initiates the file download process."""
+        if self._profile_running():
+            return
         filename = simpledialog.askstring("Download File", "Enter the filename to download:")
         if not filename:
             return
@@ -255,6 +277,8 @@ class ClientApp:
 
     def delete_file(self):
         """Initiates the file deletion process."""
+        if self._profile_running():
+            return
         filename = simpledialog.askstring("Delete File", "Enter the filename to delete:")
         if not filename:
             return
@@ -275,12 +299,158 @@ class ClientApp:
             messagebox.showerror("Error", f"An error occurred during file deletion: {e}")
             self.log(f"Error deleting file: {e}")
 
+    def show_usage(self):
+        """Requests the user's storage usage and quota from the server."""
+        if self._profile_running():
+            return
+        try:
+            with self.socket_lock:
+                # Send "USAGE" command to the server
+                self.client_socket.sendall(b"USAGE")
+
+                # Receive server response
+                response = self._recv_status()
+                messagebox.showinfo("Storage Usage", response)
+                self.log("Requested storage usage.")
+
+        except Exception as e:
+            messagebox.showerror("Error", f"An error occurred while requesting usage: {e}")
+            self.log(f"Error requesting usage: {e}")
+
+    def profile_server(self):
+        """Initiates an admin profiling window on the server."""
+        if self._profile_running():
+            return
+        seconds = simpledialog.askinteger("Profile Server", "Profiling window in seconds (1-300):", minvalue=1, maxvalue=300)
+        if not seconds:
+            return
+        secret = simpledialog.askstring("Profile Server", "Enter the admin secret:", show="*")
+        if not secret:
+            return
+        self.is_profiling = True
+        threading.Thread(target=self.profile_server_thread, args=(seconds, secret), daemon=True).start()
+
+    def profile_server_thread(self, seconds, secret):
+        """Runs the profiling request in a separate thread and shows the report."""
+        try:
+            with self.socket_lock:
+                # Send "PROFILE" command, the window length and the admin secret
+                self.client_socket.sendall(b"PROFILE")
+                self.client_socket.sendall(f"{seconds},{secret}".encode())
+                self.log(f"Requested a {seconds}s server profile.")
+
+                # Receive server response
+                status = self._recv_status()
+                if status != "OK":
+                    messagebox.showerror("Profile Error", status)
+                    self.log(f"Profile failed: {status}")
+                    return
+
+                # Receive the report in chunks once the window has elapsed
+                report = b""
+                while True:
+                    chunk_size_data = self.client_socket.recv(4)
+                    if not chunk_size_data:
+                        raise Exception("Connection closed unexpectedly during chunk size reception.")
+                    chunk_size = int.from_bytes(chunk_size_data, byteorder="big")
+                    if chunk_size == 0:
+                        break  # EOF marker received
+
+                    chunk = b""
+                    while len(chunk) < chunk_size:
+                        data = self.client_socket.recv(min(65536, chunk_size - len(chunk)))
+                        if not data:
+                            raise Exception("Connection closed unexpectedly during report reception.")
+                        chunk += data
+                    report += chunk
+
+            report = report.decode()
+            if report.startswith("ERROR"):
+                messagebox.showerror("Profile Error", report.strip())
+                self.log(f"Profile failed: {report.strip()}")
+                return
+            self.root.after(0, self._show_report, report)
+            self.log("Received server profile report.")
+
+        except Exception as e:
+            messagebox.showerror("Error", f"An error occurred during profiling: {e}")
+            self.log(f"Error during profiling: {e}")
+        finally:
+            self.is_profiling = False
+
+    def _show_report(self, report):
+        """Displays a profiling report in a scrollable window."""
+        window = tk.Toplevel(self.root)
+        window.title("Server Profile Report")
+        scrollbar = tk.Scrollbar(window)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        text = tk.Text(window, width=110, height=40, yscrollcommand=scrollbar.set)
+        text.insert(tk.END, report)
+        text.config(state=tk.DISABLED)
+        text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.config(command=text.yview)
+
+    def toggle_timing(self):
+        """Turns the server's UPLOAD/DOWNLOAD timing spans on or off."""
+        if self._profile_running():
+            return
+        enable = messagebox.askyesnocancel("Timing Spans", "Enable per-request timing spans on the server?")
+        if enable is None:
+            return
+        secret = simpledialog.askstring("Timing Spans", "Enter the admin secret:", show="*")
+        if not secret:
+            return
+        try:
+            with self.socket_lock:
+                # Send "TIMING" command, the desired state and the admin secret
+                self.client_socket.sendall(b"TIMING")
+                self.client_socket.sendall(f"{'ON' if enable else 'OFF'},{secret}".encode())
+
+                # Receive server response
+                response = self._recv_status()
+                messagebox.showinfo("Timing Spans", response)
+                self.log(f"Timing spans request: {response.strip()}")
+
+        except Exception as e:
+            messagebox.showerror("Error", f"An error occurred while toggling timing: {e}")
+            self.log(f"Error toggling timing: {e}")
+
+    def _profile_running(self):
+        """Warns and returns True if a server profile is holding the socket."""
+        if self.is_profiling:
+            messagebox.showwarning("Busy", "A server profile is running. Try again once its report arrives.")
+            return True
+        return False
+
+    def _recv_status(self):
+        """
+        Reads newline-terminated lines until one that is not a notification.
+        Notifications received first are shown as usual.
+        """
+        while True:
+            line = b""
+            while not line.endswith(b"\n"):
+                data = self.client_socket.recv(1)  # One byte at a time to never read past the line
+                if not data:
+                    raise Exception("Connection closed unexpectedly while waiting for a response.")
+                line += data
+            message = line.decode().strip()
+            if message.startswith("NOTIFICATION:"):
+                notification = message[len("NOTIFICATION:"):].strip()
+                if notification:
+                    messagebox.showinfo("Notification", notification)
+                    self.log(f"Received notification: {notification}")
+            elif message:
+                return message
+
     def exit_app(self):
         """Closes the connection and exits the application."""
         try:
             if self.client_socket:
-                with self.socket_lock:
-                    self.client_socket.sendall(b"EXIT")
+                # A running profile holds the socket; closing it is enough then
+                if not self.is_profiling:
+                    with self.socket_lock:
+                        self.client_socket.sendall(b"EXIT")
                 self.client_socket.close()
                 self.log("Disconnected from server.")
         except Exception:
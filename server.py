@@ -1,10 +1,15 @@
 # server.py
+import hmac
 import os
 import socket
+import sys
 import threading
+import time
+import tracemalloc
 import tkinter as tk
 from tkinter import filedialog, messagebox
 from threading import Lock
+from collections import Counter, deque
 
 class ServerApp:
     def __init__(self, root):
@@ -16,6 +21,14 @@ class ServerApp:
         self.uploaders = {}  # Maps uploader names to their sockets
         self.notifications = {}  # Maps uploader names to list of their notifications
         self.file_lock = Lock()  # Ensures thread-safe access to notifications
+        self.usage = {}  # Maps uploader names to {"bytes": ..., "files": ...} counters
+        self.usage_lock = Lock()  # Ensures thread-safe access to usage counters
+        self.quota_bytes = None  # Per-user storage quota in bytes (None means unlimited)
+        self.admin_secret = None  # Secret required by the PROFILE and TIMING commands (None disables them)
+        self.profile_lock = Lock()  # Ensures only one profiling window runs at a time
+        self.profiling_clients = {}  # Maps admins awaiting a profile report to notifications held back meanwhile
+        self.timing_enabled = False  # Whether UPLOAD/DOWNLOAD timing spans are recorded
+        self.timing_spans = deque(maxlen=100)  # Recent (timestamp, span description) pairs
 
         # Initialize GUI elements
         self.setup_gui()
@@ -33,6 +46,16 @@ class ServerApp:
         self.port_entry = tk.Entry(frame_top, width=10)
         self.port_entry.pack(side=tk.LEFT, padx=5)
 
+        # Per-user quota input (blank means unlimited)
+        tk.Label(frame_top, text="Quota (MB):").pack(side=tk.LEFT)
+        self.quota_entry = tk.Entry(frame_top, width=8)
+        self.quota_entry.pack(side=tk.LEFT, padx=5)
+
+        # Admin secret input (blank disables admin commands)
+        tk.Label(frame_top, text="Admin Secret:").pack(side=tk.LEFT)
+        self.admin_secret_entry = tk.Entry(frame_top, width=15, show="*")
+        self.admin_secret_entry.pack(side=tk.LEFT, padx=5)
+
         # Browse upload directory button
         tk.Button(frame_top, text="Browse Upload Directory", command=self.select_directory).pack(side=tk.LEFT, padx=5)
         self.dir_label = tk.Label(frame_top, text="No directory selected", width=30, anchor="w")
@@ -69,8 +92,14 @@ class ServerApp:
         if not self.upload_dir:
             messagebox.showerror("Error", "Please select an upload directory!")
             return
+        quota = self.quota_entry.get().strip()
+        if quota and not quota.isdigit():
+            messagebox.showerror("Error", "Invalid quota!")
+            return
 
         port = int(port)
+        self.quota_bytes = int(quota) * 1024 * 1024 if quota else None
+        self.admin_secret = self.admin_secret_entry.get() or None
         try:
             # Create and bind the server socket
             self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -79,6 +108,11 @@ class ServerApp:
             self.log(f"Server started on port {port}, listening for connections...")
             self.log(f"Upload directory: {self.upload_dir}")
 
+            # Build the usage counters once; uploads and deletions keep them up to date
+            self.load_usage()
+            if self.quota_bytes is not None:
+                self.log(f"Per-user quota: {self.quota_bytes} bytes")
+
             # Start a new thread to accept incoming connections
             threading.Thread(target=self.accept_connections, daemon=True).start()
         except Exception as e:
@@ -104,6 +138,12 @@ class ServerApp:
             if not client_name:
                 client_socket.close()
                 return
+            if "_" in client_name:
+                # Stored files are named "owner_filename", so owners cannot contain "_"
+                error_message = "ERROR: Name cannot contain '_'. Connection closed.\n"
+                client_socket.sendall(error_message.encode())
+                client_socket.close()
+                return
             if client_name in self.clients:
                 # Username already in use
                 error_message = "ERROR: Name already in use. Connection closed.\n"
@@ -139,6 +179,12 @@ class ServerApp:
                     self.handle_file_deletion(client_socket, client_name)
                 elif request == "NOTIFICATIONS":
                     self.handle_notifications(client_socket, client_name)
+                elif request == "USAGE":
+                    self.handle_usage(client_socket, client_name)
+                elif request == "PROFILE":
+                    self.handle_profile(client_socket, client_name)
+                elif request == "TIMING":
+                    self.handle_timing(client_socket, client_name)
                 elif request == "EXIT":
                     break
                 else:
@@ -160,24 +206,56 @@ class ServerApp:
 
     def handle_file_upload(self, client_socket, client_name):
         """Handles file upload from a client."""
+        partial_path = None
+        existing_size = None
+        spans = {"recv": 0.0, "disk": 0.0, "send": 0.0}
         try:
-            # Receive the filename from the client
-            filename = client_socket.recv(1024).decode().strip()
-            if not filename:
+            # Receive upload request in the format "filename,size"
+            start = time.perf_counter()
+            request = client_socket.recv(1024).decode().strip()
+            spans["recv"] += time.perf_counter() - start
+            if not request:
                 raise Exception("No filename received.")
+            if "," not in request:
+                raise Exception("Invalid upload request format.")
+
+            filename, declared_size = request.rsplit(",", 1)
+            if not filename or not declared_size.isdigit():
+                raise Exception("Invalid upload request format.")
+            declared_size = int(declared_size)
 
             unique_filename = f"{client_name}_{filename}"
             filepath = os.path.join(self.upload_dir, unique_filename)
 
-            # Receive the file data in chunks
-            with open(filepath, "wb") as f:
+            # Reject the upload before its body is sent if it would exceed the quota
+            if os.path.exists(filepath):
+                existing_size = os.path.getsize(filepath)
+            if not self.check_quota(client_name, declared_size - (existing_size or 0)):
+                self.log(f"Upload of '{unique_filename}' by '{client_name}' rejected: quota exceeded.")
+                error_message = "ERROR: Upload exceeds your storage quota.\n"
+                client_socket.sendall(error_message.encode())
+                return
+
+            # Tell the client to start sending the file body
+            start = time.perf_counter()
+            client_socket.sendall(b"OK\n")
+            spans["send"] += time.perf_counter() - start
+
+            # Receive the file data in chunks into a temporary file, so a failed
+            # upload never touches an existing copy. The name has no "_", so it is
+            # never listed or counted as an uploaded file.
+            received = 0
+            partial_path = os.path.join(self.upload_dir, f".{client_name}.upload")
+            with open(partial_path, "wb") as f:
                 while True:
                     # Receive the size of the next chunk
+                    start = time.perf_counter()
                     chunk_size_data = client_socket.recv(4)
                     if not chunk_size_data:
                         raise Exception("Connection closed unexpectedly during chunk size reception.")
                     chunk_size = int.from_bytes(chunk_size_data, byteorder="big")
                     if chunk_size == 0:
+                        spans["recv"] += time.perf_counter() - start
                         break  # EOF marker received
 
                     # Receive the actual data chunk
@@ -187,22 +265,51 @@ class ServerApp:
                         if not packet:
                             raise Exception("Connection closed unexpectedly during file data reception.")
                         data += packet
-                    f.write(data)
+                    received += len(data)
+                    spans["recv"] += time.perf_counter() - start
+
+                    # Only write what was declared; anything beyond it is read and discarded
+                    if received <= declared_size:
+                        start = time.perf_counter()
+                        f.write(data)
+                        spans["disk"] += time.perf_counter() - start
+
+            if received > declared_size:
+                raise Exception(f"Received {received} bytes but {declared_size} were declared.")
+
+            existing_size = os.path.getsize(filepath) if os.path.exists(filepath) else None
+            os.replace(partial_path, filepath)
+            partial_path = None
+
+            # Update the uploader's usage counters, replacing an overwritten file's size
+            if existing_size is None:
+                self.record_usage(client_name, received, 1)
+            else:
+                self.record_usage(client_name, received - existing_size, 0)
 
             self.log(f"File '{unique_filename}' uploaded by '{client_name}'.")
             success_message = "File uploaded successfully.\n"
+            start = time.perf_counter()
             client_socket.sendall(success_message.encode())
+            spans["send"] += time.perf_counter() - start
+            self.record_timing("UPLOAD", unique_filename, spans, received)
 
         except Exception as e:
+            # Remove the partial file; any existing copy is left untouched
+            if partial_path and os.path.exists(partial_path):
+                os.remove(partial_path)
             self.log(f"Error during file upload by '{client_name}': {e}")
             error_message = "ERROR: An error occurred during file upload.\n"
             client_socket.sendall(error_message.encode())
 
     def handle_file_download(self, client_socket, client_name):
         """Handles file download request from a client."""
+        spans = {"recv": 0.0, "disk": 0.0, "send": 0.0}
         try:
             # Receive download request in the format "filename,owner"
+            start = time.perf_counter()
             request = client_socket.recv(1024).decode().strip()
+            spans["recv"] += time.perf_counter() - start
             if not request:
                 raise Exception("No download request received.")
             if "," not in request:
@@ -218,17 +325,26 @@ class ServerApp:
                 self.log(f"Sending file '{unique_filename}' to '{client_name}'...")
 
                 # Send the file in chunks
+                sent = 0
                 with open(filepath, "rb") as f:
                     while True:
+                        start = time.perf_counter()
                         chunk = f.read(65536)  # Read in 64 KB chunks
+                        spans["disk"] += time.perf_counter() - start
                         if not chunk:
                             break
                         chunk_size = len(chunk).to_bytes(4, byteorder="big")
+                        start = time.perf_counter()
                         client_socket.sendall(chunk_size + chunk)
+                        spans["send"] += time.perf_counter() - start
+                        sent += len(chunk)
 
                 # Send EOF marker
+                start = time.perf_counter()
                 client_socket.sendall((0).to_bytes(4, byteorder="big"))
+                spans["send"] += time.perf_counter() - start
                 self.log(f"File '{unique_filename}' sent to '{client_name}'.")
+                self.record_timing("DOWNLOAD", unique_filename, spans, sent)
 
                 # Create a notification for the uploader
                 notification = f"Your file '{filename}' was downloaded by {client_name}."
@@ -239,9 +355,13 @@ class ServerApp:
                         self.notifications[owner] = [notification]
                     self.log(f"Notification stored for '{owner}': '{notification}'")
 
-                # If the uploader is online, send the notification immediately
+                # If the uploader is online, send the notification immediately, unless it
+                # is waiting for a profile report that the notification would break up
                 with self.file_lock:
-                    if owner in self.uploaders:
+                    if owner in self.profiling_clients:
+                        self.profiling_clients[owner].append(notification)
+                        self.log(f"Real-time notification to '{owner}' held until their profile report is sent.")
+                    elif owner in self.uploaders:
                         try:
                             uploader_socket = self.uploaders[owner]
                             real_time_message = f"NOTIFICATION:{notification}\n"
@@ -297,7 +417,9 @@ class ServerApp:
 
             if os.path.exists(filepath):
                 # Remove the file from the server
+                file_size = os.path.getsize(filepath)
                 os.remove(filepath)
+                self.record_usage(client_name, -file_size, -1)
                 self.log(f"File '{unique_filename}' deleted by '{client_name}'.")
 
                 success_message = "File deleted successfully.\n"
@@ -333,6 +455,235 @@ class ServerApp:
             error_message = "ERROR: An error occurred during notifications retrieval.\n"
             client_socket.sendall(error_message.encode())
 
+    def handle_usage(self, client_socket, client_name):
+        """Sends the client's current storage usage and quota."""
+        try:
+            with self.usage_lock:
+                usage = dict(self.usage.get(client_name, {"bytes": 0, "files": 0}))
+            quota = f"{self.quota_bytes} bytes" if self.quota_bytes is not None else "unlimited"
+            usage_message = f"Used: {usage['bytes']} bytes in {usage['files']} file(s). Quota: {quota}.\n"
+            client_socket.sendall(usage_message.encode())
+            self.log(f"Sent usage to '{client_name}'.")
+        except Exception as e:
+            self.log(f"Error during usage handling for '{client_name}': {e}")
+            error_message = "ERROR: An error occurred during usage retrieval.\n"
+            client_socket.sendall(error_message.encode())
+
+    def handle_profile(self, client_socket, client_name):
+        """Profiles the live server for a time window and sends the report to an admin."""
+        with self.file_lock:
+            self.profiling_clients[client_name] = []
+        streaming = False  # Set once "OK" is sent; from then on only framed chunks may follow
+        closed = False  # Set if the socket is closed after a failed report send
+        try:
+            # Receive profile request in the format "seconds,secret"
+            request = client_socket.recv(1024).decode().strip()
+            window, _, secret = request.partition(",")
+            if not self.check_admin_secret(secret):
+                client_socket.sendall(b"ERROR: Admin privileges required.\n")
+                self.log(f"Profile request by '{client_name}' refused: bad admin secret.")
+                return
+            if not window.isdigit() or not 1 <= int(window) <= 300:
+                client_socket.sendall(b"ERROR: Profiling window must be 1-300 seconds.\n")
+                self.log(f"Profile request by '{client_name}' refused: invalid window '{window}'.")
+                return
+            if not self.profile_lock.acquire(blocking=False):
+                client_socket.sendall(b"ERROR: A profiling window is already running.\n")
+                self.log(f"Profile request by '{client_name}' refused: a profiling window is already running.")
+                return
+
+            try:
+                client_socket.sendall(b"OK\n")
+                streaming = True
+                self.log(f"Profiling started by '{client_name}' for {window}s.")
+                try:
+                    report = self.profile_window(int(window))
+                except Exception as e:
+                    # Sent in place of the report, framed like it
+                    self.log(f"Error while profiling for '{client_name}': {e}")
+                    report = "ERROR: An error occurred during profiling.\n"
+            finally:
+                self.profile_lock.release()
+
+            # Send the report in chunks, like a file download
+            data = report.encode()
+            for offset in range(0, len(data), 65536):
+                chunk = data[offset:offset + 65536]
+                client_socket.sendall(len(chunk).to_bytes(4, byteorder="big") + chunk)
+            client_socket.sendall((0).to_bytes(4, byteorder="big"))
+            self.log(f"Profile report sent to '{client_name}'.")
+        except Exception as e:
+            self.log(f"Error during profiling for '{client_name}': {e}")
+            if streaming:
+                # A partial chunk may have been sent; close rather than desync the client
+                client_socket.close()
+                closed = True
+            else:
+                error_message = "ERROR: An error occurred during profiling.\n"
+                client_socket.sendall(error_message.encode())
+        finally:
+            # Deliver the notifications held back during the profile, if the socket is still open
+            with self.file_lock:
+                held = self.profiling_clients.pop(client_name, [])
+                if closed:
+                    held = []
+                for notification in held:
+                    try:
+                        client_socket.sendall(f"NOTIFICATION:{notification}\n".encode())
+                    except Exception as e:
+                        self.log(f"Failed to send held notification to '{client_name}': {e}")
+
+    def handle_timing(self, client_socket, client_name):
+        """Turns UPLOAD/DOWNLOAD timing spans on or off for an admin."""
+        try:
+            # Receive timing request in the format "state,secret", where state is "ON" or "OFF"
+            request = client_socket.recv(1024).decode().strip()
+            state, _, secret = request.partition(",")
+            state = state.upper()
+            if not self.check_admin_secret(secret):
+                client_socket.sendall(b"ERROR: Admin privileges required.\n")
+                self.log(f"Timing request by '{client_name}' refused: bad admin secret.")
+                return
+            if state not in ("ON", "OFF"):
+                client_socket.sendall(b"ERROR: Timing state must be ON or OFF.\n")
+                return
+
+            self.timing_enabled = state == "ON"
+            self.log(f"Timing spans turned {state} by '{client_name}'.")
+            client_socket.sendall(f"Timing spans turned {state}.\n".encode())
+        except Exception as e:
+            self.log(f"Error during timing toggle for '{client_name}': {e}")
+            error_message = "ERROR: An error occurred while toggling timing.\n"
+            client_socket.sendall(error_message.encode())
+
+    def check_admin_secret(self, secret):
+        """Returns True if the secret matches the configured admin secret."""
+        if not self.admin_secret:
+            return False
+        return hmac.compare_digest(secret.encode(), self.admin_secret.encode())
+
+    def profile_window(self, seconds, interval=0.01):
+        """Samples every thread's stack and traces allocations for a window; returns a text report."""
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        try:
+            start_snapshot = tracemalloc.take_snapshot()
+            window_start = time.time()
+
+            # A thread whose innermost function is one of these is waiting for work, not
+            # serving it: the accept loop, the command read in handle_client, the Tk event loop
+            idle_codes = {socket.socket.accept.__code__, self.handle_client.__code__, tk.Misc.mainloop.__code__}
+
+            # Sample the stacks of all other threads at a fixed interval
+            own_thread = threading.get_ident()
+            self_counts = Counter()
+            total_counts = Counter()
+            idle_counts = Counter()
+            rounds = 0
+            thread_samples = 0
+            end = time.perf_counter() + seconds
+            while time.perf_counter() < end:
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_thread:
+                        continue
+                    thread_samples += 1
+                    if frame.f_code in idle_codes:
+                        idle_counts[frame.f_code] += 1
+                        continue
+                    self_counts[frame.f_code] += 1
+                    seen = set()
+                    while frame is not None:
+                        if frame.f_code not in seen:
+                            total_counts[frame.f_code] += 1
+                            seen.add(frame.f_code)
+                        frame = frame.f_back
+                rounds += 1
+                time.sleep(interval)
+
+            end_snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            if started_tracing:
+                tracemalloc.stop()
+
+        # Compare against the start of the window, leaving out tracemalloc's own allocations
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<unknown>")]
+        start_snapshot = start_snapshot.filter_traces(filters)
+        end_snapshot = end_snapshot.filter_traces(filters)
+        allocations = [stat for stat in end_snapshot.compare_to(start_snapshot, "lineno") if stat.size_diff]
+
+        # Format the report; percentages are of all wall-clock thread samples
+        active = sum(self_counts.values())
+        idle = sum(idle_counts.values())
+        total = max(thread_samples, 1)
+        lines = [f"Profile window: {seconds}s, {rounds} rounds every {interval * 1000:.0f} ms",
+                 f"Thread samples: {thread_samples} ({active} serving requests, {idle} waiting for work)", ""]
+        lines.append("Top functions by own samples (includes time blocked in socket or disk I/O):")
+        for code, count in self_counts.most_common(15):
+            lines.append(f"  {count:6d}  {100 * count / total:6.1f}%  {self.code_label(code)}")
+        lines.append("")
+        lines.append("Top functions by inclusive samples:")
+        for code, count in total_counts.most_common(15):
+            lines.append(f"  {count:6d}  {100 * count / total:6.1f}%  {self.code_label(code)}")
+        lines.append("")
+        lines.append("Waiting for work (accept loop, command read, Tk event loop):")
+        for code, count in idle_counts.most_common():
+            lines.append(f"  {count:6d}  {100 * count / total:6.1f}%  {self.code_label(code)}")
+        lines.append("")
+        peak_scope = "during window" if started_tracing else "since tracing was started elsewhere"
+        lines.append(f"Traced memory: current {current} bytes, peak {peak} bytes ({peak_scope})")
+        lines.append("Top allocations during window by line:")
+        for stat in allocations[:10]:
+            lines.append(f"  {stat}")
+        spans = [span for timestamp, span in list(self.timing_spans) if timestamp >= window_start]
+        if spans:
+            lines.append("")
+            lines.append("Timing spans during window:")
+            lines.extend(f"  {span}" for span in spans)
+        return "\n".join(lines) + "\n"
+
+    def code_label(self, code):
+        """Returns a "file:line(function)" label for a code object."""
+        return f"{os.path.basename(code.co_filename)}:{code.co_firstlineno}({code.co_name})"
+
+    def record_timing(self, command, filename, spans, num_bytes):
+        """Logs and stores the phase timings of a transfer if timing spans are enabled."""
+        if not self.timing_enabled:
+            return
+        span = (f"{command} '{filename}' {num_bytes} bytes: recv {spans['recv']:.3f}s, "
+                f"disk {spans['disk']:.3f}s, send {spans['send']:.3f}s")
+        self.timing_spans.append((time.time(), span))
+        self.log(f"Timing: {span}")
+
+    def load_usage(self):
+        """Builds the per-user usage counters from the upload directory."""
+        usage = {}
+        for file in os.listdir(self.upload_dir):
+            filepath = os.path.join(self.upload_dir, file)
+            if "_" in file and os.path.isfile(filepath):
+                owner = file.split("_", 1)[0]
+                entry = usage.setdefault(owner, {"bytes": 0, "files": 0})
+                entry["bytes"] += os.path.getsize(filepath)
+                entry["files"] += 1
+        with self.usage_lock:
+            self.usage = usage
+
+    def record_usage(self, client_name, byte_delta, file_delta):
+        """Adjusts a user's usage counters by the given deltas."""
+        with self.usage_lock:
+            entry = self.usage.setdefault(client_name, {"bytes": 0, "files": 0})
+            entry["bytes"] += byte_delta
+            entry["files"] += file_delta
+
+    def check_quota(self, client_name, byte_delta):
+        """Returns True if adding byte_delta bytes keeps the user within the quota."""
+        if self.quota_bytes is None:
+            return True
+        with self.usage_lock:
+            used = self.usage.get(client_name, {"bytes": 0})["bytes"]
+        return used + byte_delta <= self.quota_bytes
+
     def stop_server(self):
         """Stops the server and closes all connections."""
         try: